@@ -15,6 +15,8 @@
 # limitations under the License.
 
 import json
+import os
+import re
 import unittest
 import unittest.mock as mock
 
@@ -24,20 +26,101 @@ import ops.testing
 import src.charm as charm
 
 
+_METHOD_RE = re.compile(rb'"method"\s*:\s*"([^"]+)"')
+_NQN_RE = re.compile(rb'"nqn"\s*:\s*"([^"]*)"')
+
+_OK = {'nqn': 'nqn.1', 'addr': '3.3.3.3', 'port': 1,
+       'pool': 'mypool', 'image': 'myimage', 'cluster': 'ceph.1'}
+_OK_BYTES = json.dumps(_OK).encode('utf8')
+_OK_LIST_BYTES = json.dumps([_OK]).encode('utf8')
+_EMPTY_BYTES = b'{}'
+_HOST_ERROR_BYTES = b'{"error": ""}'
+
+_CHARM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Output of 'relation-get' for a peer, as read by _get_unit_addr.
+_UNIT_ADDRS = (
+    b'{"private-address":"1.1.1.1","egress-subnets":"1.1.1.1/32",'
+    b'"ingress-address":"1.1.1.1"}')
+
+_CEPH_RELATION_DATA = {
+    'key': 'some-key',
+    'mon_hosts': '2.2.2.2',
+    'auth': 'some-auth',
+}
+
+
+# The RPC traffic each test expects, as (method, is-local) pairs.
+
+# local-create, remote-create, local-join, remote-join
+CREATE_CALLS = (('create', True), ('create', False),
+                ('join', True), ('join', False))
+# No remote calls without HA.
+CREATE_NO_HA_CALLS = (('create', True),)
+# local-find, remote-leave, local-remove
+DELETE_CALLS = (('find', True), ('leave', False), ('remove', True))
+# local-find, remote-find, local-create, remote-join, local-join
+JOIN_CALLS = (('find', True), ('find', False), ('create', True),
+              ('join', False), ('join', True))
+# local-addhost, remote-addhost
+ADD_HOST_CALLS = (('host_add', True), ('host_add', False))
+# local-deletehost, remote-deletehost
+DELETE_HOST_CALLS = (('host_del', True), ('host_del', False))
+# local-list, remote-leave, local-remove
+RESET_TARGET_CALLS = (('list', True), ('leave', False), ('remove', True))
+# local-list, remote-leave
+RELATION_DEPARTED_CALLS = (('list', True), ('leave', False))
+
+
+def _read_charm_file(name):
+    with open(os.path.join(_CHARM_DIR, name)) as file:
+        return file.read()
+
+
+def _knows_nqn(msg):
+    match = _NQN_RE.search(msg)
+    return match is not None and match.group(1) == b'nqn.1'
+
+
+def _on_create(msg, skip):
+    return _EMPTY_BYTES if skip else _OK_BYTES
+
+
+def _on_list(msg, skip):
+    return _OK_LIST_BYTES
+
+
+def _on_find(msg, skip):
+    return _OK_BYTES if not skip and _knows_nqn(msg) else _EMPTY_BYTES
+
+
+def _on_host_change(msg, skip):
+    return _OK_BYTES if not skip and _knows_nqn(msg) else _HOST_ERROR_BYTES
+
+
+# How the mock proxy answers each RPC method; anything else gets '{}'.
+_HANDLERS = {
+    'create': _on_create,
+    'list': _on_list,
+    'find': _on_find,
+    'host_add': _on_host_change,
+    'host_del': _on_host_change,
+}
+
+
 class MockSocket:
     def __init__(self, skip_first=False, cached_resp={}):
-        self.sendto = mock.MagicMock()
-        self.sendto.side_effect = self._sendto
-        self.recv = mock.MagicMock()
-        self.recv.side_effect = self._recv
+        self.calls = []
         self.response = None
         self.skip_first = skip_first
         self.cached_resp = cached_resp
 
-    def _sendto(self, msg, *args):
-        self.response = self._compute_response(msg)
+    def sendto(self, msg, addr):
+        method = _METHOD_RE.search(msg).group(1).decode('utf8')
+        self.calls.append((method, addr))
+        self.response = self._compute_response(method, msg)
 
-    def _recv(self, *args):
+    def recv(self, *args):
         ret = self.response
         self.response = None
         return ret
@@ -45,33 +128,68 @@ class MockSocket:
     def close(self):
         pass
 
-    def _compute_response(self, msg):
-        msg = json.loads(msg)
-        method = msg['method']
+    def _compute_response(self, method, msg):
         resp = self.cached_resp.get(method)
         if resp is not None:
             return resp
-        elif method not in ('create', 'list', 'find', 'host_add', 'host_del'):
-            return b'{}'
 
-        ret = {'nqn': 'nqn.1', 'addr': '3.3.3.3', 'port': 1,
-               'pool': 'mypool', 'image': 'myimage', 'cluster': 'ceph.1'}
-        if method == 'list':
-            ret = [ret]
-        elif (method in ('find', 'host_add', 'host_del') and
-                msg['params']['nqn'] != 'nqn.1' or self.skip_first):
-            ret = {}
-            if method in ('host_add', 'host_del'):
-                ret['error'] = ""
+        handler = _HANDLERS.get(method)
+        if handler is None:
+            return _EMPTY_BYTES
+
+        skip, self.skip_first = self.skip_first, False
+        return handler(msg, skip)
+
 
-        self.skip_first = False
-        return json.dumps(ret).encode('utf8')
+class MockEvent:
+    def __init__(self, params=None):
+        self.params = params or {}
+        self.results = []
+        self.failures = []
+        self.deferred = False
+
+    def set_results(self, results):
+        self.results.append(results)
+
+    def fail(self, message=''):
+        self.failures.append(message)
+
+    def defer(self):
+        self.deferred = True
 
 
 class TestCharm(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Load the charm metadata once for the whole test case instead of
+        # having every Harness read it back from disk.
+        cls.meta = _read_charm_file('metadata.yaml')
+        cls.actions = _read_charm_file('actions.yaml')
+        cls.config = _read_charm_file('config.yaml')
+
     def setUp(self):
-        self.harness = ops.testing.Harness(charm.CephNVMECharm)
+        # A Harness can only be begun once and keeps the charm's stored
+        # state in its framework, so every test gets a fresh one. Tearing
+        # it down only closes the in-memory store, which is cheap.
+        self.harness = ops.testing.Harness(
+            charm.CephNVMECharm, meta=self.meta,
+            actions=self.actions, config=self.config)
         self.addCleanup(self.harness.cleanup)
+        self._block_network()
+        patcher = mock.patch.object(charm.subprocess, 'check_output')
+        self.check_output = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _block_network(self):
+        # The RPC socket is replaced by a MockSocket, so any real socket
+        # or name lookup means a test is leaking out to the network.
+        for name in ('socket', 'create_connection', 'getaddrinfo', 'getfqdn'):
+            patcher = mock.patch.object(
+                charm.socket, name, side_effect=OSError(
+                    'network access attempted from a unit test'))
+            mocked = patcher.start()
+            self.addCleanup(patcher.stop)
+            self.addCleanup(mocked.assert_not_called)
 
     def add_peers(self):
         rel_id = self.harness.add_relation('peers', 'ceph-nvme')
@@ -81,45 +199,35 @@ class TestCharm(unittest.TestCase):
         rel_id = self.harness.add_relation('ceph-client', 'ceph-mon')
         self.harness.add_relation_unit(rel_id, 'ceph-mon/0')
         self.harness.update_relation_data(
-            rel_id,
-            'ceph-mon/0',
-            {
-                'key': 'some-key',
-                'mon_hosts': '2.2.2.2',
-                'auth': 'some-auth',
-            })
-
-    def _check_calls(self, call_args_list, expected):
-        calls = [(json.loads(call.args[0])['method'], call.args[1][0])
-                 for call in call_args_list]
-
-        self.assertEqual(len(calls), len(expected))
-        for i, (method, local) in enumerate(expected):
-            self.assertEqual(calls[i][0], method)
-            self.assertEqual(calls[i][1] != '1.1.1.1', local)
-
-    def _setup_mock_params(self, check_output, **kwargs):
-        check_output.return_value = (
-            b'{"private-address":"1.1.1.1","egress-subnets":"1.1.1.1/32",'
-            b'"ingress-address":"1.1.1.1"}')
-        event = mock.MagicMock()
-        event.set_results = mock.MagicMock()
-        event.fail = mock.MagicMock()
+            rel_id, 'ceph-mon/0', _CEPH_RELATION_DATA)
+
+    def _check_calls(self, rpc_calls, expected):
+        calls = [(method, addr[0] != '1.1.1.1') for method, addr in rpc_calls]
+        self.assertSequenceEqual(calls, expected)
+
+    def _setup_mock_params_minimal(self, **kwargs):
+        self.check_output.return_value = _UNIT_ADDRS
+        event = MockEvent()
         rpc_sock = MockSocket(**kwargs)
 
         self.harness.begin()
         charm = self.harness.charm
         charm._rpc_sock = lambda *_: rpc_sock
+        return charm, rpc_sock, event
 
+    def _add_relations(self):
         self.add_peers()
         self.add_ceph_relation()
-        return charm, rpc_sock, event
 
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_broken_ceph_relation(self, check_output):
+    def _setup_mock_params(self, **kwargs):
+        ret = self._setup_mock_params_minimal(**kwargs)
+        self._add_relations()
+        return ret
+
+    def test_broken_ceph_relation(self):
         cached_resp = {'cluster_add': b'{"error": {"code": -2}}'}
         charm, rpc_sock, event = self._setup_mock_params(
-            check_output, cached_resp=cached_resp)
+            cached_resp=cached_resp)
 
         charm._stored.installed_services = True
 
@@ -128,11 +236,10 @@ class TestCharm(unittest.TestCase):
 
         event.fail = _fail
         charm._on_ceph_relation_changed(event)
-        event.defer.assert_called()
+        self.assertTrue(event.deferred)
 
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_create(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
+    def test_create(self):
+        charm, rpc_sock, event = self._setup_mock_params()
         event.params = {
             'rbd-pool': 'mypool',
             'rbd-image': 'myimage',
@@ -140,22 +247,15 @@ class TestCharm(unittest.TestCase):
         }
 
         charm.on_create_endpoint_action(event)
-        event.set_results.assert_called_with(
+        self.assertEqual(
+            event.results[-1],
             {'nqn': 'nqn.1', 'address': '3.3.3.3',
              'port': 1, 'units': 2})
 
-        # We expect the following calls:
-        # local-create
-        # remote-create
-        # local-join
-        # remote-join
-        expected = [('create', True), ('create', False),
-                    ('join', True), ('join', False)]
-        self._check_calls(rpc_sock.sendto.call_args_list, expected)
-
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_create_no_ha(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
+        self._check_calls(rpc_sock.calls, CREATE_CALLS)
+
+    def test_create_no_ha(self):
+        charm, rpc_sock, event = self._setup_mock_params()
         event.params = {
             'rbd-pool': 'mypool',
             'rbd-image': 'myimage',
@@ -163,143 +263,93 @@ class TestCharm(unittest.TestCase):
         }
 
         charm.on_create_endpoint_action(event)
-        event.set_results.assert_called_with(
+        self.assertEqual(
+            event.results[-1],
             {'nqn': 'nqn.1', 'address': '3.3.3.3',
              'port': 1, 'units': 1})
 
-        # We expect no remote calls for this test.
-        expected = [('create', True)]
-        self._check_calls(rpc_sock.sendto.call_args_list, expected)
+        self._check_calls(rpc_sock.calls, CREATE_NO_HA_CALLS)
 
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_delete(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
+    def test_delete(self):
+        charm, rpc_sock, event = self._setup_mock_params()
         event.params = {'nqn': 'nqn.1'}
 
         charm.on_delete_endpoint_action(event)
-        event.set_results.assert_called_with({'message': 'success'})
-
-        # We expect the following calls:
-        # local-find
-        # remote-leave
-        # local-remove
-        expected = [('find', True), ('leave', False), ('remove', True)]
-        self._check_calls(rpc_sock.sendto.call_args_list, expected)
+        self.assertEqual(event.results[-1], {'message': 'success'})
 
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_delete_fail(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
-        event.params = {'nqn': 'nonexistent'}
+        self._check_calls(rpc_sock.calls, DELETE_CALLS)
 
-        charm.on_delete_endpoint_action(event)
-        event.fail.assert_called()
+    def test_action_failures(self):
+        charm, _, _ = self._setup_mock_params_minimal()
+        # Joining only looks for the NQN once there are peers to ask; none
+        # of these actions need the Ceph relation.
+        self.add_peers()
+        # Each of these refers to an NQN that isn't present and should
+        # fail without further side effects, so they can share a charm.
+        failures = (
+            (charm.on_delete_endpoint_action, {'nqn': 'nonexistent'}),
+            (charm.on_join_endpoint_action, {'nqn': 'nonexistent'}),
+            (charm.on_add_host_action,
+             {'hostnqn': 'host_nqn', 'nqn': 'nonexistent'}),
+            (charm.on_delete_host_action,
+             {'host': 'host_nqn', 'nqn': 'nonexistent'}),
+        )
+
+        for action, params in failures:
+            with self.subTest(action=action.__name__):
+                event = MockEvent(params)
+                action(event)
+                self.assertTrue(event.failures)
 
-    @mock.patch.object(charm.subprocess, 'check_output')
     @mock.patch.object(charm.subprocess, 'run')
-    def test_join(self, run, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output,
-                                                         skip_first=True)
+    def test_join(self, run):
+        charm, rpc_sock, event = self._setup_mock_params(skip_first=True)
         charm._select_addr = lambda *_: '1.1.1.1'
         event.params = {'nqn': 'nqn.1'}
 
         charm.on_join_endpoint_action(event)
-        event.set_results.assert_called_with(
+        self.assertEqual(
+            event.results[-1],
             {'nqn': 'nqn.1', 'address': '3.3.3.3',
              'port': 1, 'units': 1})
 
-        # We expect the following calls:
-        # local-find
-        # remote-find
-        # local-create
-        # remote-join
-        # local-join
-        expected = [('find', True), ('find', False), ('create', True),
-                    ('join', False), ('join', True)]
-        self._check_calls(rpc_sock.sendto.call_args_list, expected)
-
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_join_failed(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
-        event.params = {'nqn': 'nonexistent'}
-
-        charm.on_join_endpoint_action(event)
-        event.fail.assert_called()
+        self._check_calls(rpc_sock.calls, JOIN_CALLS)
 
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_list(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
+    def test_list(self):
+        charm, rpc_sock, event = self._setup_mock_params()
 
         charm.on_list_endpoints_action(event)
-        args = event.set_results.call_args_list[0][0][0]['endpoints']
+        args = event.results[0]['endpoints']
         self.assertEqual(len(args), 1)
         self.assertEqual(args[0]['nqn'], 'nqn.1')
 
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_add_host(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
+    def test_add_host(self):
+        charm, rpc_sock, event = self._setup_mock_params()
         event.params = {'hostnqn': 'host_nqn', 'nqn': 'nqn.1',
                         'dhchap-key': 'some-key'}
 
         charm.on_add_host_action(event)
-        event.set_results.assert_called()
-
-        # We expect the following calls:
-        # local-addhost
-        # remove-addhost
-
-        expected = [('host_add', True), ('host_add', False)]
-        self._check_calls(rpc_sock.sendto.call_args_list, expected)
+        self.assertTrue(event.results)
 
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_add_host_failed(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
-        event.params = {'hostnqn': 'host_nqn', 'nqn': 'nonexistent'}
+        self._check_calls(rpc_sock.calls, ADD_HOST_CALLS)
 
-        charm.on_add_host_action(event)
-        event.fail.assert_called()
-
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_delete_host(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
+    def test_delete_host(self):
+        charm, rpc_sock, event = self._setup_mock_params()
         event.params = {'host': 'host_nqn', 'nqn': 'nqn.1'}
         charm.on_delete_host_action(event)
 
-        # We expect the following calls:
-        # local-deletehost
-        # remote-deletehost
-
-        event.set_results.assert_called()
-        expected = [('host_del', True), ('host_del', False)]
-        self._check_calls(rpc_sock.sendto.call_args_list, expected)
+        self.assertTrue(event.results)
+        self._check_calls(rpc_sock.calls, DELETE_HOST_CALLS)
 
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_delete_host_failed(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
-        event.params = {'host': 'host_nqn', 'nqn': 'nonexistent'}
-        charm.on_delete_host_action(event)
+    @mock.patch.object(charm.subprocess, 'check_call')
+    def test_reset_target(self, check_call):
+        charm, rpc_sock, event = self._setup_mock_params()
+        charm.on_reset_target_action(event)
 
-        event.fail.assert_called()
+        self._check_calls(rpc_sock.calls, RESET_TARGET_CALLS)
 
-    @mock.patch.object(charm.subprocess, 'check_call')
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_reset_target(self, check_output, check_call):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
-        self.harness.charm.on_reset_target_action(mock.MagicMock())
-
-        # We expect the following calls:
-        # local-list
-        # remote-leave
-        # local-remove
-        expected = [('list', True), ('leave', False), ('remove', True)]
-        self._check_calls(rpc_sock.sendto.call_args_list, expected)
-
-    @mock.patch.object(charm.subprocess, 'check_output')
-    def test_relation_departed(self, check_output):
-        charm, rpc_sock, event = self._setup_mock_params(check_output)
+    def test_relation_departed(self):
+        charm, rpc_sock, event = self._setup_mock_params()
         charm.on_peers_relation_departed(event)
 
-        # We expect the following calls:
-        # local-list
-        # remote-leave
-        expected = [('list', True), ('leave', False)]
-        self._check_calls(rpc_sock.sendto.call_args_list, expected)
+        self._check_calls(rpc_sock.calls, RELATION_DEPARTED_CALLS)
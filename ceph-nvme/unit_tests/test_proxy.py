@@ -55,7 +55,8 @@ class TestBase(unittest.TestCase):
     def setUp(self):
         self.rpc = proxy.utils.RPC()
         self.proxy_addr = ('127.0.0.1', self.LOCAL_PORT)
-        self.sock_path = '/tmp/nvme-test-%d.sock' % id(self)
+        # Include the pid so parallel test workers never share a path.
+        self.sock_path = '/tmp/nvme-test-%d-%d.sock' % (os.getpid(), id(self))
 
         if os.path.exists(self.sock_path):
             os.unlink(self.sock_path)
@@ -395,6 +395,9 @@ def set_hdd_read_ahead(dev_name, read_ahead_sectors=256):
             level=ERROR)
 
 
+BLKID_UUID_RE = re.compile(rb'^UUID=(\S+)', re.MULTILINE)
+
+
 def get_block_uuid(block_dev):
     """This queries blkid to get the uuid for a block device.
 
@@ -402,13 +405,11 @@ def get_block_uuid(block_dev):
     :returns: The UUID of the device or None on Error.
     """
     try:
-        block_info = str(subprocess
-                         .check_output(['blkid', '-o', 'export', block_dev])
-                         .decode('UTF-8'))
-        for tag in block_info.split('\n'):
-            parts = tag.split('=')
-            if parts[0] == 'UUID':
-                return parts[1]
+        block_info = subprocess.check_output(
+            ['blkid', '-o', 'export', block_dev])
+        match = BLKID_UUID_RE.search(block_info)
+        if match:
+            return match.group(1).decode('UTF-8')
         return None
     except subprocess.CalledProcessError as err:
         log('get_block_uuid failed with error: {}'.format(err.output),
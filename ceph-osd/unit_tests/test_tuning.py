@@ -1,5 +1,5 @@
 __author__ = 'Chris Holcombe <chris.holcombe@canonical.com>'
-from unittest.mock import patch, call
+from unittest.mock import patch, call, DEFAULT
 import test_utils
 import charms_ceph.utils as ceph
 
@@ -13,6 +13,7 @@ TO_PATCH = [
 class PerformanceTestCase(test_utils.CharmTestCase):
     def setUp(self):
         super(PerformanceTestCase, self).setUp(ceph, TO_PATCH)
+        self.block_network()
 
     @patch.object(ceph.subprocess, 'check_output')
     @patch.object(ceph, 'get_link_speed')
@@ -49,74 +50,50 @@ class PerformanceTestCase(test_utils.CharmTestCase):
         uuid = ceph.get_block_uuid('/dev/sda1')
         self.assertEqual(uuid, '378f3c86-b21a-4172-832d-e2b3d4bc7511')
 
-    @patch.object(ceph, 'persist_settings')
-    @patch.object(ceph, 'set_hdd_read_ahead')
-    @patch.object(ceph, 'get_max_sectors_kb')
-    @patch.object(ceph, 'get_max_hw_sectors_kb')
-    @patch.object(ceph, 'set_max_sectors_kb')
-    @patch.object(ceph, 'get_block_uuid')
-    def test_tune_dev(self,
-                      block_uuid,
-                      set_max_sectors_kb,
-                      get_max_hw_sectors_kb,
-                      get_max_sectors_kb,
-                      set_hdd_read_ahead,
-                      persist_settings):
-        self.hookenv.config.return_value = 712
-        block_uuid.return_value = '378f3c86-b21a-4172-832d-e2b3d4bc7511'
-        set_hdd_read_ahead.return_value = None
-        get_max_sectors_kb.return_value = 512
-        get_max_hw_sectors_kb.return_value = 1024
+    @patch.object(ceph.subprocess, 'check_output')
+    def test_get_block_uuid_missing(self, check_output):
+        check_output.return_value = \
+            b'PARTUUID=5a1c9e4f-01\nUUID_SUB=1234\nTYPE=ext2\n'
+        self.assertIsNone(ceph.get_block_uuid('/dev/sda1'))
+
+    @patch.multiple(ceph,
+                    persist_settings=DEFAULT,
+                    set_hdd_read_ahead=DEFAULT,
+                    get_max_sectors_kb=DEFAULT,
+                    get_max_hw_sectors_kb=DEFAULT,
+                    set_max_sectors_kb=DEFAULT,
+                    get_block_uuid=DEFAULT)
+    def _check_tune_dev(self, config_value, expected_size, **mocks):
+        self.hookenv.config.return_value = config_value
+        mocks['get_block_uuid'].return_value = \
+            '378f3c86-b21a-4172-832d-e2b3d4bc7511'
+        mocks['set_hdd_read_ahead'].return_value = None
+        mocks['get_max_sectors_kb'].return_value = 512
+        mocks['get_max_hw_sectors_kb'].return_value = 1024
         ceph.tune_dev('/dev/sda')
-        # The config value was lower than the hardware value.
-        # We use the lower value.  The user wants 712 but the hw supports
-        # 1K
-        set_max_sectors_kb.assert_called_with(
-            dev_name='sda', max_sectors_size=712
+        mocks['set_max_sectors_kb'].assert_called_with(
+            dev_name='sda', max_sectors_size=expected_size
         )
-        persist_settings.assert_called_with(
+        mocks['persist_settings'].assert_called_with(
             settings_dict={'drive_settings': {
                 '378f3c86-b21a-4172-832d-e2b3d4bc7511': {
-                    'read_ahead_sect': 712}}}
+                    'read_ahead_sect': expected_size}}}
         )
         self.status_set.assert_has_calls([
             call('maintenance', 'Tuning device /dev/sda'),
             call('maintenance', 'Finished tuning device /dev/sda')
         ])
 
-    @patch.object(ceph, 'persist_settings')
-    @patch.object(ceph, 'set_hdd_read_ahead')
-    @patch.object(ceph, 'get_max_sectors_kb')
-    @patch.object(ceph, 'get_max_hw_sectors_kb')
-    @patch.object(ceph, 'set_max_sectors_kb')
-    @patch.object(ceph, 'get_block_uuid')
-    def test_tune_dev_2(self,
-                        block_uuid,
-                        set_max_sectors_kb,
-                        get_max_hw_sectors_kb,
-                        get_max_sectors_kb,
-                        set_hdd_read_ahead,
-                        persist_settings):
-        self.hookenv.config.return_value = 2048
-        block_uuid.return_value = '378f3c86-b21a-4172-832d-e2b3d4bc7511'
-        set_hdd_read_ahead.return_value = None
-        get_max_sectors_kb.return_value = 512
-        get_max_hw_sectors_kb.return_value = 1024
-        ceph.tune_dev('/dev/sda')
+    def test_tune_dev(self):
+        # The config value was lower than the hardware value.
+        # We use the lower value.  The user wants 712 but the hw supports
+        # 1K
+        self._check_tune_dev(712, 712)
+
+    def test_tune_dev_2(self):
         # The config value was higher than the hardware value.
         # We use the lower value.  The user wants 2K but the hw only support 1K
-        set_max_sectors_kb.assert_called_with(
-            dev_name='sda', max_sectors_size=1024
-        )
-        persist_settings.assert_called_with(
-            settings_dict={'drive_settings': {
-                '378f3c86-b21a-4172-832d-e2b3d4bc7511': {
-                    'read_ahead_sect': 1024}}}
-        )
-        self.status_set.assert_has_calls([
-            call('maintenance', 'Tuning device /dev/sda'),
-            call('maintenance', 'Finished tuning device /dev/sda')
-        ])
+        self._check_tune_dev(2048, 1024)
 
     @patch.object(ceph.subprocess, 'check_output')
     def test_set_hdd_read_ahead(self, check_output):
@@ -3,26 +3,35 @@ from test_utils import CharmTestCase
 from ceph_hooks import check_for_upgrade, notify_mon_of_upgrade
 
 
-__author__ = 'Chris Holcombe <chris.holcombe@canonical.com>'
+# Patched for every upgrade test and exposed as attributes of the test case.
+UPGRADE_TO_PATCH = {
+    'hookenv': 'ceph_hooks.hookenv',
+    'emit_cephconf': 'ceph_hooks.emit_cephconf',
+    'notify_mon_of_upgrade': 'ceph_hooks.notify_mon_of_upgrade',
+    'add_source': 'ceph_hooks.add_source',
+    'exists': 'ceph_hooks.os.path.exists',
+    'dirs_need_ownership_update': 'ceph_hooks.ceph.dirs_need_ownership_update',
+    'roll_osd_cluster': 'ceph_hooks.ceph.roll_osd_cluster',
+    'roll_monitor_cluster': 'ceph_hooks.ceph.roll_monitor_cluster',
+    'find_filestore_osds': 'utils.find_filestore_osds',
+}
 
 
 class UpgradeRollingTestCase(CharmTestCase):
 
-    @patch('ceph_hooks.notify_mon_of_upgrade')
-    @patch('ceph_hooks.ceph.dirs_need_ownership_update')
-    @patch('ceph_hooks.os.path.exists')
+    def setUp(self):
+        super(UpgradeRollingTestCase, self).setUp()
+        self.block_network()
+        for name, target in UPGRADE_TO_PATCH.items():
+            _m = patch(target)
+            setattr(self, name, _m.start())
+            self.addCleanup(_m.stop)
+        self.exists.return_value = True
+        self.dirs_need_ownership_update.return_value = False
+        self.find_filestore_osds.return_value = []
+
     @patch('ceph_hooks.ceph.resolve_ceph_version')
-    @patch('ceph_hooks.emit_cephconf')
-    @patch('ceph_hooks.hookenv')
-    @patch('ceph_hooks.ceph.roll_osd_cluster')
-    @patch('utils.find_filestore_osds')
-    def test_check_for_upgrade(self, find_filestore_osds,
-                               roll_osd_cluster, hookenv,
-                               emit_cephconf, version, exists,
-                               dirs_need_ownership_update,
-                               notify_mon_of_upgrade):
-        dirs_need_ownership_update.return_value = False
-        exists.return_value = True
+    def test_check_for_upgrade(self, version):
         version_pre = 'firefly'
         version_post = 'hammer'
         version.side_effect = [version_pre, version_post]
@@ -31,141 +40,85 @@ class UpgradeRollingTestCase(CharmTestCase):
         self.test_config.set('source', 'cloud:trusty-kilo')
         self.test_config.set('key', 'key')
 
-        hookenv.config.side_effect = self.test_config
+        self.hookenv.config.side_effect = self.test_config
         check_for_upgrade()
 
-        roll_osd_cluster.assert_called_with(new_version='hammer',
-                                            upgrade_key='osd-upgrade')
-        emit_cephconf.assert_has_calls([call(upgrading=True),
-                                        call(upgrading=False)])
-        exists.assert_called_with(
+        self.roll_osd_cluster.assert_called_with(new_version='hammer',
+                                                 upgrade_key='osd-upgrade')
+        self.emit_cephconf.assert_has_calls([call(upgrading=True),
+                                             call(upgrading=False)])
+        self.exists.assert_called_with(
             "/var/lib/ceph/osd/ceph.client.osd-upgrade.keyring")
-        notify_mon_of_upgrade.assert_called_once_with(version_post)
+        self.notify_mon_of_upgrade.assert_called_once_with(version_post)
 
-    @patch('ceph_hooks.notify_mon_of_upgrade')
-    @patch('ceph_hooks.ceph.dirs_need_ownership_update')
-    @patch('ceph_hooks.os.path.exists')
     @patch('ceph_hooks.ceph.resolve_ceph_version')
-    @patch('ceph_hooks.emit_cephconf')
-    @patch('ceph_hooks.hookenv')
-    @patch('ceph_hooks.ceph.roll_osd_cluster')
-    @patch('utils.find_filestore_osds')
-    def test_resume_failed_upgrade(self, find_filestore_osds,
-                                   roll_osd_cluster,
-                                   hookenv, emit_cephconf, version,
-                                   exists,
-                                   dirs_need_ownership_update,
-                                   notify_mon_of_upgrade):
-        dirs_need_ownership_update.return_value = True
-        exists.return_value = True
+    def test_resume_failed_upgrade(self, version):
+        self.dirs_need_ownership_update.return_value = True
         version_pre_and_post = 'jewel'
         version.side_effect = [version_pre_and_post, version_pre_and_post]
 
         check_for_upgrade()
 
-        roll_osd_cluster.assert_called_with(new_version='jewel',
-                                            upgrade_key='osd-upgrade')
-        emit_cephconf.assert_has_calls([call(upgrading=True),
-                                        call(upgrading=False)])
-        exists.assert_called_with(
+        self.roll_osd_cluster.assert_called_with(new_version='jewel',
+                                                 upgrade_key='osd-upgrade')
+        self.emit_cephconf.assert_has_calls([call(upgrading=True),
+                                             call(upgrading=False)])
+        self.exists.assert_called_with(
             "/var/lib/ceph/osd/ceph.client.osd-upgrade.keyring")
-        notify_mon_of_upgrade.assert_called_once_with(version_pre_and_post)
+        self.notify_mon_of_upgrade.assert_called_once_with(
+            version_pre_and_post)
 
-    @patch('ceph_hooks.os.path.exists')
     @patch('ceph_hooks.ceph.resolve_ceph_version')
-    @patch('ceph_hooks.hookenv')
-    @patch('ceph_hooks.ceph.roll_monitor_cluster')
-    def test_check_for_upgrade_not_bootstrapped(self, roll_monitor_cluster,
-                                                hookenv,
-                                                version, exists):
-        exists.return_value = False
+    def test_check_for_upgrade_not_bootstrapped(self, version):
+        self.exists.return_value = False
         version.side_effect = ['firefly', 'hammer']
 
         self.test_config.set_previous('source', "cloud:trusty-juno")
         self.test_config.set('source', 'cloud:trusty-kilo')
         self.test_config.set('key', 'key')
 
-        hookenv.config.side_effect = self.test_config
+        self.hookenv.config.side_effect = self.test_config
         check_for_upgrade()
 
-        roll_monitor_cluster.assert_not_called()
-        exists.assert_called_with(
+        self.roll_monitor_cluster.assert_not_called()
+        self.exists.assert_called_with(
             "/var/lib/ceph/osd/ceph.client.osd-upgrade.keyring")
 
-    @patch('ceph_hooks.os.path.exists')
-    @patch('ceph_hooks.ceph.dirs_need_ownership_update')
-    @patch('ceph_hooks.add_source')
-    @patch('ceph_hooks.ceph.is_bootstrapped')
-    @patch('ceph_hooks.hookenv')
-    @patch('ceph_hooks.ceph.roll_monitor_cluster')
-    @patch('utils.find_filestore_osds')
-    def test_check_for_upgrade_from_pike_to_queens(self, find_filestore_osds,
-                                                   roll_monitor_cluster,
-                                                   hookenv, is_bootstrapped,
-                                                   add_source,
-                                                   dirs_need_ownership_update,
-                                                   exists):
-        exists.return_value = True
-        dirs_need_ownership_update.return_value = False
-        is_bootstrapped.return_value = True
-        hookenv.config.side_effect = self.test_config
+    def test_check_for_upgrade_from_pike_to_queens(self):
+        self.hookenv.config.side_effect = self.test_config
         self.test_config.set('key', 'some-key')
         self.test_config.set_previous('source', 'cloud:xenial-pike')
         self.test_config.set('source', 'cloud:xenial-queens')
         check_for_upgrade()
-        roll_monitor_cluster.assert_not_called()
-        add_source.assert_called_with('cloud:xenial-queens', 'some-key')
-
-    @patch('ceph_hooks.os.path.exists')
-    @patch('ceph_hooks.ceph.dirs_need_ownership_update')
-    @patch('ceph_hooks.add_source')
-    @patch('ceph_hooks.ceph.is_bootstrapped')
-    @patch('ceph_hooks.hookenv')
-    @patch('ceph_hooks.ceph.roll_monitor_cluster')
-    @patch('utils.find_filestore_osds')
-    def test_check_for_upgrade_from_rocky_to_stein(self, find_filestore_osds,
-                                                   roll_monitor_cluster,
-                                                   hookenv, is_bootstrapped,
-                                                   add_source,
-                                                   dirs_need_ownership_update,
-                                                   exists):
-        exists.return_value = True
-        dirs_need_ownership_update.return_value = False
-        is_bootstrapped.return_value = True
-        hookenv.config.side_effect = self.test_config
+        self.roll_monitor_cluster.assert_not_called()
+        self.add_source.assert_called_with('cloud:xenial-queens', 'some-key')
+
+    def test_check_for_upgrade_from_rocky_to_stein(self):
+        self.hookenv.config.side_effect = self.test_config
         self.test_config.set('key', 'some-key')
         self.test_config.set_previous('source', 'cloud:bionic-rocky')
         self.test_config.set('source', 'cloud:bionic-stein')
         check_for_upgrade()
-        roll_monitor_cluster.assert_not_called()
-        add_source.assert_called_with('cloud:bionic-stein', 'some-key')
-
-    @patch('ceph_hooks.os.path.exists')
-    @patch('ceph_hooks.ceph.dirs_need_ownership_update')
-    @patch('ceph_hooks.add_source')
-    @patch('ceph_hooks.ceph.is_bootstrapped')
-    @patch('ceph_hooks.hookenv')
-    @patch('ceph_hooks.ceph.roll_monitor_cluster')
-    @patch('utils.find_filestore_osds')
-    def test_check_for_upgrade_reef_filestore(self, find_filestore_osds,
-                                              roll_monitor_cluster,
-                                              hookenv, is_bootstrapped,
-                                              add_source,
-                                              dirs_need_ownership_update,
-                                              exists):
-        exists.return_value = True
-        is_bootstrapped.return_value = True
-        find_filestore_osds.return_value = ['ceph-0']
-        hookenv.config.side_effect = self.test_config
+        self.roll_monitor_cluster.assert_not_called()
+        self.add_source.assert_called_with('cloud:bionic-stein', 'some-key')
+
+    def test_check_for_upgrade_reef_filestore(self):
+        self.find_filestore_osds.return_value = ['ceph-0']
+        self.hookenv.config.side_effect = self.test_config
         self.test_config.set('key', 'some-key')
         self.test_config.set_previous('source', 'cloud:jammy-antelope')
         self.test_config.set('source', 'cloud:jammy-bobcat')
         check_for_upgrade()
-        roll_monitor_cluster.assert_not_called()
-        dirs_need_ownership_update.assert_not_called()
+        self.roll_monitor_cluster.assert_not_called()
+        self.dirs_need_ownership_update.assert_not_called()
 
 
 class UpgradeUtilTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(UpgradeUtilTestCase, self).setUp()
+        self.block_network()
+
     @patch('ceph_hooks.relation_ids')
     @patch('ceph_hooks.log')
     @patch('ceph_hooks.relation_set')
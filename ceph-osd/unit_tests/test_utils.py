@@ -12,9 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import logging
 import unittest
 import os
+import socket
 import sys
 import yaml
 
@@ -28,10 +30,13 @@ sys.modules['apt'] = mock_apt
 mock_apt.apt_pkg = MagicMock()
 
 
+@functools.lru_cache(maxsize=None)
 def load_config():
     '''
     Walk backwards from __file__ looking for config.yaml, load and return the
     'options' section'
+
+    The result is cached, so callers must not modify it.
     '''
     config = None
     f = __file__
@@ -85,6 +90,15 @@ class CharmTestCase(unittest.TestCase):
         for method in self.patches:
             setattr(self, method, self.patch(method))
 
+    def block_network(self):
+        '''Fail the test if it opens a socket or resolves a host name.'''
+        for name in ('socket', 'create_connection', 'getaddrinfo'):
+            _m = patch.object(socket, name, side_effect=OSError(
+                'network access attempted from a unit test'))
+            mock = _m.start()
+            self.addCleanup(_m.stop)
+            self.addCleanup(mock.assert_not_called)
+
 
 class TestConfig(object):
 
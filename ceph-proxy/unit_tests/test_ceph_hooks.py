@@ -1,3 +1,4 @@
+from types import SimpleNamespace
 from unittest import mock
 import sys
 
@@ -23,6 +24,10 @@ CEPH_GET_KEY = """[client.admin]
         caps osd = "allow *"
 """ % CEPH_KEY
 
+# Stands in for hookenv.config() when only the previous values are read.
+PREVIOUS_CONFIG = SimpleNamespace(
+    previous={'source': 'distro', 'key': ''}.get)
+
 TO_PATCH = [
     'config',
     'install_alternative',
@@ -156,12 +161,7 @@ class TestHooks(test_utils.CharmTestCase):
     def test_config_get_skips_package_update(self,
                                              mock_package_install,
                                              mock_emit_cephconf):
-        previous_test_config = test_utils.TestConfig()
-        previous_test_config.set('source', 'distro')
-        previous_test_config.set('key', '')
-        previous = mock.MagicMock().return_value
-        previous.previous.side_effect = lambda x: previous_test_config.get(x)
-        self.config.side_effect = [previous, "distro", ""]
+        self.config.side_effect = [PREVIOUS_CONFIG, "distro", ""]
         hooks.config_changed()
         mock_package_install.assert_not_called()
         mock_emit_cephconf.assert_any_call()
@@ -219,13 +219,7 @@ class TestHooks(test_utils.CharmTestCase):
     @mock.patch('ceph_hooks.emit_cephconf')
     @mock.patch('ceph_hooks.package_install')
     def test_update_apt_source(self, mock_package_install, mock_emit_cephconf):
-
-        previous_test_config = test_utils.TestConfig()
-        previous_test_config.set('source', 'distro')
-        previous_test_config.set('key', '')
-        previous = mock.MagicMock().return_value
-        previous.previous.side_effect = lambda x: previous_test_config.get(x)
-        self.config.side_effect = [previous, "cloud:cosmic-mimic", ""]
+        self.config.side_effect = [PREVIOUS_CONFIG, "cloud:cosmic-mimic", ""]
         hooks.config_changed()
         mock_package_install.assert_called_with()
         mock_emit_cephconf.assert_called_with()